@@ -1,34 +1,49 @@
 #!/usr/bin/env python3
-import os, datetime, html, smtplib, ssl, requests, re
+import os, io, datetime, functools, smtplib, ssl, requests, re, threading, time, sqlite3
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from dotenv import load_dotenv
 from zoneinfo import ZoneInfo
 from urllib3.util.retry import Retry
 from requests.adapters import HTTPAdapter
-import xml.etree.ElementTree as ET
+try:
+    from lxml import etree as ET
+    ITERPARSE_KW = {"tag": "PubmedArticle"}  # lxml filters events in C
+except ImportError:
+    import xml.etree.ElementTree as ET
+    ITERPARSE_KW = {}
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
 from pathlib import Path
+from jinja2 import Environment
+from collections import deque
 
 load_dotenv()
 
-JOURNALS = [
+JOURNALS = (
     "Pain[ta]","Pain Physician[ta]","Pain Med[ta]","Reg Anesth Pain Med[ta]",
     "J Pain[ta]","Interv Pain Med[ta]","Cephalalgia[ta]","J Headache Pain[ta]",
     "Pain Rep[ta]","J Pain Res[ta]","Eur J Pain[ta]","Pain Ther[ta]",
     "Scand J Pain[ta]","Mol Pain[ta]","Pain Pract[ta]","Pain Res Manag[ta]"
-]
-KEYWORDS = [
+)
+KEYWORDS = (
     "Pain Management","Pain Measurement","Analgesia","\"Analgesics, Non-Narcotic\"",
     "\"Analgesics, Opioid\"","\"Nerve Block\"","\"Epidural Analgesia\"",
     "\"Spinal Cord Stimulation\"","Neuromodulation","\"Local Anesthesia\"",
     "\"Anesthesia, Local\"","\"Anesthesia, Epidural\"","Injections",
     "\"Acupuncture Therapy\"","\"Physical Therapy Modalities\"",
     "\"Surgical Procedures, Operative\"","Therapeutics"
-]
+)
+JOURNAL_HEADER = ", ".join(j.replace("[ta]", "") for j in JOURNALS)
 
 ADD_HUMANS_FILTER = False
 INCLUDE_CONCLUSION_SNIPPET = True
 SNIPPET_MAX_WORDS = 70
+# Above this many items (and with ABSTRACTS_BASE_URL set) the email carries titles + links only.
+EMAIL_SNIPPET_MAX_ITEMS = 100
 
 EMAIL_TO   = os.environ["EMAIL_TO"]
 EMAIL_FROM = os.environ["EMAIL_FROM"]
@@ -41,19 +56,41 @@ NCBI_TOOL    = os.environ.get("NCBI_TOOL", "pain-weekly-bot")
 NCBI_EMAIL   = os.environ.get("NCBI_EMAIL", "")
 NCBI_API_KEY = os.environ.get("NCBI_API_KEY", "")
 ABSTRACTS_BASE_URL = os.environ.get("ABSTRACTS_BASE_URL", "").rstrip("/")
+CACHE_DB = os.environ.get("CACHE_DB", "cache.db")  # empty string disables the PMID cache
+
+# NCBI allows 3 requests/s per client, 10 with an API key.
+NCBI_MAX_RPS = 10 if NCBI_API_KEY else 3
+EFETCH_WORKERS = NCBI_MAX_RPS
 
 IST = ZoneInfo("Asia/Kolkata")
 
 def make_session():
     s = requests.Session()
+    # eutils JSON/XML compresses ~5-10x; bodies are decoded by urllib3 (see efetch_chunk).
+    s.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
     retries = Retry(total=5, backoff_factor=0.5,
                     status_forcelist=(429,500,502,503,504),
                     allowed_methods=frozenset(["GET","POST"]))
-    s.mount("https://", HTTPAdapter(max_retries=retries))
-    s.mount("http://",  HTTPAdapter(max_retries=retries))
+    # One keep-alive connection per concurrent efetch worker, shared by every eutils call.
+    adapter = HTTPAdapter(max_retries=retries, pool_connections=1, pool_maxsize=EFETCH_WORKERS)
+    s.mount("https://", adapter)
+    s.mount("http://",  adapter)
     return s
 SESSION = make_session()
 
+# Sliding one-second window: up to NCBI_MAX_RPS requests may start together,
+# the next one waits until the oldest of them is a second old.
+_ncbi_lock = threading.Lock()
+_ncbi_starts = deque(maxlen=NCBI_MAX_RPS)
+def ncbi_throttle():
+    with _ncbi_lock:
+        start = time.monotonic()
+        if len(_ncbi_starts) == NCBI_MAX_RPS:
+            start = max(start, _ncbi_starts[0] + 1.0)
+        _ncbi_starts.append(start)
+    wait = start - time.monotonic()
+    if wait > 0: time.sleep(wait)
+
 def pubmed_query(journals, keywords, humans=False):
     j = " OR ".join(journals)
     k = " OR ".join(keywords) if keywords else ""
@@ -61,6 +98,7 @@ def pubmed_query(journals, keywords, humans=False):
     if k: core = f"{core} AND ({k})"
     if humans: core = f"{core} AND (humans[MeSH Terms])"
     return core.strip()
+DEFAULT_TERM = pubmed_query(JOURNALS, KEYWORDS, humans=ADD_HUMANS_FILTER)
 
 def last_7d_window_ist(today_ist=None):
     if today_ist is None:
@@ -78,77 +116,143 @@ def eutils_params(extra=None):
 def esearch(term, mindate, maxdate):
     params = eutils_params({
         "db":"pubmed","term":term,"retmode":"json","retmax":300,
-        "datetype":"edat","mindate":mindate,"maxdate":maxdate
+        "datetype":"edat","mindate":mindate,"maxdate":maxdate,"usehistory":"y"
     })
+    ncbi_throttle()
     r = SESSION.get(f"{EUTILS}/esearch.fcgi", params=params, timeout=30)
     r.raise_for_status()
-    return r.json().get("esearchresult", {}).get("idlist", [])
+    res = json_loads(r.content).get("esearchresult", {})
+    idlist = res.get("idlist", [])
+    # History handle for exactly this idlist: the first len(idlist) records of the stored set.
+    history = None
+    if res.get("webenv") and res.get("querykey"):
+        history = {"WebEnv": res["webenv"], "query_key": res["querykey"], "retstart": 0, "retmax": len(idlist)}
+    return idlist, history
 
-def esummary(pmids):
-    if not pmids: return []
-    params = eutils_params({"db":"pubmed","retmode":"json","id":",".join(pmids)})
+def esummary(pmids=None, history=None):
+    # Pass either an id list, or the history handle from esearch (which stands for its unmodified idlist).
+    if history:
+        if not history["retmax"]: return []
+        params = eutils_params({"db":"pubmed","retmode":"json", **history})
+    else:
+        if not pmids: return []
+        params = eutils_params({"db":"pubmed","retmode":"json","id":",".join(pmids)})
+    ncbi_throttle()
     r = SESSION.get(f"{EUTILS}/esummary.fcgi", params=params, timeout=30)
     r.raise_for_status()
-    result = r.json().get("result", {})
-    items = []
+    result = json_loads(r.content).get("result", {})
+    dedup = {}  # first record per DOI (or PMID when there is no DOI), in response order
     for pid, v in result.items():
         if pid == "uids": continue
         title = (v.get("title") or "").strip()
         journal = v.get("fulljournalname") or v.get("source") or ""
         sortdate = v.get("sortpubdate") or v.get("pubdate") or ""
-        doi = ""
-        for idv in v.get("articleids", []):
-            if idv.get("idtype") == "doi":
-                doi = idv.get("value"); break
-        items.append({
+        doi = next((idv.get("value") for idv in v.get("articleids", ()) if idv.get("idtype") == "doi"), "")
+        # esummary flags records with an abstract in "attributes"; if the field is missing, assume one.
+        has_abstract = "Has Abstract" in v["attributes"] if "attributes" in v else True
+        key = ("doi", doi.lower()) if doi else ("pmid", pid)
+        dedup.setdefault(key, {
             "pmid": pid, "title": title, "journal": journal, "date": sortdate,
-            "doi": doi, "url": f"https://pubmed.ncbi.nlm.nih.gov/{pid}/"
+            "doi": doi, "url": f"https://pubmed.ncbi.nlm.nih.gov/{pid}/",
+            "hasabstract": has_abstract
         })
-    dedup = {}
-    for it in items:
-        key = ("doi", (it["doi"] or "").lower()) if it["doi"] else ("pmid", it["pmid"])
-        if key not in dedup: dedup[key] = it
     items = list(dedup.values())
 
-    def parse_sortdate(s):
-        try: return datetime.datetime.strptime(s, "%Y/%m/%d")
-        except Exception: return datetime.datetime.min
-    items.sort(key=lambda x: parse_sortdate(x["date"]), reverse=True)
+    def sortdate_key(s):
+        # "YYYY/MM/DD[ HH:MM]" is zero-padded, so the date prefix sorts correctly as a string.
+        return s[:10] if len(s) >= 10 and s[4] == "/" and s[7] == "/" else ""
+    items.sort(key=lambda x: sortdate_key(x["date"]), reverse=True)
     return items
 
+def article_abstract(art):
+    # Fixed PubmedArticle layout: direct child paths, no ".//" subtree scans.
+    mc = art.find("MedlineCitation")
+    pmid_el = mc.find("PMID") if mc is not None else None
+    if pmid_el is None or not pmid_el.text: return None
+    pid = pmid_el.text.strip()
+    abstract_el = mc.find("Article/Abstract")
+    abstract_texts, conclusion_texts = [], []
+    if abstract_el is not None:
+        for t in abstract_el.iterfind("AbstractText"):
+            label = (t.get("Label") or t.get("NlmCategory") or "").strip().lower()
+            text = ((t.text or "") if len(t) == 0 else "".join(t.itertext())).strip()
+            if not text: continue
+            abstract_texts.append(text)
+            if "conclusion" in label: conclusion_texts.append(text)
+    abstract = " ".join(abstract_texts).strip() if abstract_texts else None
+    conclusion = " ".join(conclusion_texts).strip() if conclusion_texts else None
+    return pid, {"abstract": abstract, "conclusion": conclusion}
+
+def efetch_chunk(chunk):
+    out = {}
+    params = eutils_params({"db":"pubmed","id":",".join(chunk),"retmode":"xml"})
+    ncbi_throttle()
+    # POST keeps the id list out of the URL (NCBI recommends it above ~200 ids).
+    with SESSION.post(f"{EUTILS}/efetch.fcgi", data=params, timeout=60, stream=True) as r:
+        r.raise_for_status()
+        r.raw.decode_content = True  # urllib3 undoes any gzip transfer encoding
+        # Parse straight off the socket so only one PubmedArticle subtree is alive at a time.
+        for _, art in ET.iterparse(r.raw, events=("end",), **ITERPARSE_KW):
+            if art.tag != "PubmedArticle": continue
+            parsed = article_abstract(art)
+            if parsed: out[parsed[0]] = parsed[1]
+            art.clear()
+            if hasattr(art, "getparent"):  # lxml: also drop the emptied siblings
+                while art.getprevious() is not None: del art.getparent()[0]
+    return out
+
 def efetch_abstract_map(pmids):
     out = {}
     if not pmids: return out
     BATCH = 100
-    for i in range(0, len(pmids), BATCH):
-        chunk = pmids[i:i+BATCH]
-        params = eutils_params({"db":"pubmed","id":",".join(chunk),"retmode":"xml"})
-        r = SESSION.get(f"{EUTILS}/efetch.fcgi", params=params, timeout=60)
-        r.raise_for_status()
-        root = ET.fromstring(r.text)
-        for art in root.findall(".//PubmedArticle"):
-            pmid_el = art.find(".//MedlineCitation/PMID")
-            if pmid_el is None or not pmid_el.text: continue
-            pid = pmid_el.text.strip()
-            abstract_el = art.find(".//MedlineCitation/Article/Abstract")
-            abstract_texts, conclusion_texts = [], []
-            if abstract_el is not None:
-                for t in abstract_el.findall("./AbstractText"):
-                    label = (t.get("Label") or t.get("NlmCategory") or "").strip().lower()
-                    text = "".join(t.itertext()).strip()
-                    if not text: continue
-                    abstract_texts.append(text)
-                    if "conclusion" in label: conclusion_texts.append(text)
-            abstract = " ".join(abstract_texts).strip() if abstract_texts else None
-            conclusion = " ".join(conclusion_texts).strip() if conclusion_texts else None
-            out[pid] = {"abstract": abstract, "conclusion": conclusion}
+    chunks = [pmids[i:i+BATCH] for i in range(0, len(pmids), BATCH)]
+    # Batches are independent round-trips; overlap them, paced by ncbi_throttle.
+    with ThreadPoolExecutor(max_workers=EFETCH_WORKERS) as ex:
+        for f in as_completed([ex.submit(efetch_chunk, c) for c in chunks]): out.update(f.result())
     return out
 
+def cached_abstract_map(pmids, path=CACHE_DB):
+    # Returns (meta_map, cache_hits).
+    if not path: return efetch_abstract_map(pmids), 0
+    con = sqlite3.connect(path)
+    try:
+        con.execute("CREATE TABLE IF NOT EXISTS articles("
+                    "pmid TEXT PRIMARY KEY, abstract TEXT, conclusion TEXT, fetched_at TEXT)")
+        out = {}
+        BATCH = 500  # stay under SQLite's host-parameter limit
+        for i in range(0, len(pmids), BATCH):
+            chunk = pmids[i:i+BATCH]
+            q = f"SELECT pmid, abstract, conclusion FROM articles WHERE pmid IN ({','.join('?' * len(chunk))})"
+            for pid, abstract, conclusion in con.execute(q, chunk):
+                out[pid] = {"abstract": abstract, "conclusion": conclusion}
+        hits = len(out)
+        misses = [pid for pid in pmids if pid not in out]
+        fetched = efetch_abstract_map(misses)
+        # Only cache records that have an abstract; one may still be added upstream.
+        now = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+        rows = [(pid, m["abstract"], m["conclusion"], now) for pid, m in fetched.items() if m["abstract"]]
+        with con:
+            con.executemany("INSERT OR REPLACE INTO articles VALUES (?,?,?,?)", rows)
+        out.update(fetched)
+        return out, hits
+    finally:
+        con.close()
+
+# Same mapping as html.escape(quote=True), applied in a single pass.
+_ESC = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#x27;"})
+def esc(text):
+    return text.translate(_ESC)
+# Journal names and dates repeat across a week's items; titles are unique and use esc().
+esc_cached = functools.lru_cache(maxsize=64)(esc)
+
+_SENT_RE = re.compile(r'(?<=[.!?])\s+')
 def last_sentences(text, n=2):
-    parts = re.split(r'(?<=[.!?])\s+', text.strip())
-    parts = [p for p in parts if p]
-    if not parts: return ""
-    return " ".join(parts[-n:]).strip()
+    text = text.strip()
+    if n <= 0: return " ".join(_SENT_RE.split(text)[-n:])  # same slice semantics as before
+    # Only the last n boundaries matter; split just the tail instead of the whole abstract.
+    cuts = deque(_SENT_RE.finditer(text), maxlen=n)
+    if len(cuts) == n: text = text[cuts[0].end():]
+    return " ".join(_SENT_RE.split(text))
 
 def trim_words(text, max_words):
     words = text.split()
@@ -164,87 +268,86 @@ def build_snippet(meta_map_entry):
         return ("From abstract", trim_words(fallback, SNIPPET_MAX_WORDS))
     return (None, None)
 
-def build_abstracts_page(items, meta_map, mindate, maxdate, out_path="abstracts.html"):
-    rows = []
-    for it in items:
-        pmid = it["pmid"]
-        title = html.escape(it["title"])
-        j = html.escape(it["journal"])
-        date = html.escape(it["date"])
-        doi = it["doi"]
-        doi_html = f'<div>DOI: <a href="https://doi.org/{html.escape(doi)}">{html.escape(doi)}</a></div>' if doi else ""
-        abs_meta = meta_map.get(pmid, {}) if meta_map else {}
-        abstract = abs_meta.get("abstract") or "(No abstract available)"
-        abstract = html.escape(abstract)
-        rows.append(f"""
-        <section id="{pmid}" style="margin-bottom:2rem;">
-          <h3>{title}</h3>
-          <div><em>{j}</em> ({date}) | PMID: <a href="https://pubmed.ncbi.nlm.nih.gov/{pmid}/">{pmid}</a></div>
-          {doi_html}
-          <h4>Abstract</h4>
-          <p>{abstract}</p>
-          <div><a href="#top">Back to top</a></div>
-        </section>
-        """)
-    page = f"""<!doctype html>
+ABSTRACTS_PAGE = Environment(autoescape=True, trim_blocks=True, lstrip_blocks=True).from_string("""\
+<!doctype html>
 <html lang="en"><head>
 <meta charset="utf-8" />
-<title>Pain Literature Abstracts — {mindate} to {maxdate}</title>
+<title>Pain Literature Abstracts — {{ mindate }} to {{ maxdate }}</title>
 <meta name="viewport" content="width=device-width, initial-scale=1" />
 </head><body>
 <a id="top"></a>
 <h1>Pain Literature Abstracts</h1>
-<p>Coverage (EDAT): {mindate} to {maxdate}</p>
-{' '.join(rows) if rows else '<p>No abstracts this week.</p>'}
-</body></html>"""
-    Path(out_path).write_text(page, encoding="utf-8")
+<p>Coverage (EDAT): {{ mindate }} to {{ maxdate }}</p>
+{% for it in items %}
+<section id="{{ it.pmid }}" style="margin-bottom:2rem;">
+  <h3>{{ it.title }}</h3>
+  <div><em>{{ it.journal }}</em> ({{ it.date }}) | PMID: <a href="https://pubmed.ncbi.nlm.nih.gov/{{ it.pmid }}/">{{ it.pmid }}</a></div>
+  {% if it.doi %}
+  <div>DOI: <a href="https://doi.org/{{ it.doi }}">{{ it.doi }}</a></div>
+  {% endif %}
+  <h4>Abstract</h4>
+  <p>{{ (meta_map.get(it.pmid) or {}).get("abstract") or "(No abstract available)" }}</p>
+  <div><a href="#top">Back to top</a></div>
+</section>
+{% else %}
+<p>No abstracts this week.</p>
+{% endfor %}
+</body></html>""")
+
+def build_abstracts_page(items, meta_map, mindate, maxdate, out_path="abstracts.html"):
+    # Rendered section by section straight to disk; autoescape replaces the manual esc() calls.
+    ABSTRACTS_PAGE.stream(items=items, meta_map=meta_map or {}, mindate=mindate,
+                          maxdate=maxdate).dump(out_path, encoding="utf-8")
     return out_path
 
+def email_snippets(items, meta_map):
+    if not INCLUDE_CONCLUSION_SNIPPET or meta_map is None: return False
+    return not (ABSTRACTS_BASE_URL and len(items) > EMAIL_SNIPPET_MAX_ITEMS)
+
 def build_html(items, mindate, maxdate, meta_map=None):
     if not items:
         return f"<p>No new items between {mindate} and {maxdate}.</p>"
-    rows = []
+    buf = io.StringIO()
+    w = buf.write
+    w(f"""
+    <h2>Pain Literature Weekly</h2>
+    <p>Coverage (EDAT): {mindate} to {maxdate}; journals: {JOURNAL_HEADER}</p>
+    <ol>
+    """)
+    snippets = email_snippets(items, meta_map)
     for it in items:
-        title = html.escape(it["title"])
-        j = html.escape(it["journal"])
-        date = html.escape(it["date"])
         doi = it["doi"]
-        doi_link = f' | DOI: <a href="https://doi.org/{doi}">{html.escape(doi)}</a>' if doi else ""
-        snippet_html = ""
-        if INCLUDE_CONCLUSION_SNIPPET and meta_map is not None:
+        w(f'<li><a href="{it["url"]}">{esc(it["title"])}</a>'
+          f' — <em>{esc_cached(it["journal"])}</em> ({esc_cached(it["date"])})')
+        if doi: w(f' | DOI: <a href="https://doi.org/{doi}">{esc(doi)}</a>')
+        if ABSTRACTS_BASE_URL:
+            w(f' <a href="{ABSTRACTS_BASE_URL}/abstracts.html#{it["pmid"]}">Full abstract</a>')
+        if snippets:
             label, snip = build_snippet(meta_map.get(it["pmid"]))
             if snip:
-                snippet_html = f'<div><strong>{html.escape(label)}:</strong> {html.escape(snip)}</div>'
-        full_abs_link = ""
-        if ABSTRACTS_BASE_URL:
-            full_abs_link = f' <a href="{ABSTRACTS_BASE_URL}/abstracts.html#{it["pmid"]}">Full abstract</a>'
-        rows.append(
-            f'<li><a href="{it["url"]}">{title}</a>'
-            f' — <em>{j}</em> ({date}){doi_link}{full_abs_link}'
-            f'{snippet_html}</li>'
-        )
-    return f"""
-    <h2>Pain Literature Weekly</h2>
-    <p>Coverage (EDAT): {mindate} to {maxdate}; journals: {', '.join([j.replace('[ta]','') for j in JOURNALS])}</p>
-    <ol>
-    {''.join(rows)}
+                w(f'<div><strong>{esc(label)}:</strong> {esc(snip)}</div>')
+        w('</li>')
+    w("""
     </ol>
-    """
+    """)
+    return buf.getvalue()
 
 def build_text(items, mindate, maxdate, meta_map=None):
     if not items:
         return f"No new items between {mindate} and {maxdate}."
-    lines = [f"Pain Literature Weekly", f"Coverage (EDAT): {mindate} to {maxdate}"]
+    buf = io.StringIO()
+    w = buf.write
+    w(f"Pain Literature Weekly\nCoverage (EDAT): {mindate} to {maxdate}")
+    snippets = email_snippets(items, meta_map)
     for it in items:
-        doi_part = f" | DOI: https://doi.org/{it['doi']}" if it["doi"] else ""
-        full_abs = f" | Full abstract: {ABSTRACTS_BASE_URL}/abstracts.html#{it['pmid']}" if ABSTRACTS_BASE_URL else ""
-        base = f"- {it['title']} — {it['journal']} ({it['date']}) {it['url']}{doi_part}{full_abs}"
-        if INCLUDE_CONCLUSION_SNIPPET and meta_map is not None:
+        w(f"\n- {it['title']} — {it['journal']} ({it['date']}) {it['url']}")
+        if it["doi"]: w(f" | DOI: https://doi.org/{it['doi']}")
+        if ABSTRACTS_BASE_URL: w(f" | Full abstract: {ABSTRACTS_BASE_URL}/abstracts.html#{it['pmid']}")
+        if snippets:
             label, snip = build_snippet(meta_map.get(it["pmid"]))
             if snip:
-                base += f"\n  {label}: {snip}"
-        lines.append(base)
-    return "\n".join(lines)
+                w(f"\n  {label}: {snip}")
+    return buf.getvalue()
 
 def send_email(html_body, text_body, subject):
     msg = MIMEMultipart("alternative")
@@ -254,6 +357,10 @@ def send_email(html_body, text_body, subject):
     msg.attach(MIMEText(text_body, "plain"))
     msg.attach(MIMEText(html_body, "html"))
     ctx = ssl.create_default_context()
+    if SMTP_PORT == 465:  # implicit TLS: no EHLO/STARTTLS round trip before the handshake
+        with smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, context=ctx) as s:
+            s.login(SMTP_USER, SMTP_PASS); s.send_message(msg)
+        return
     with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as s:
         s.starttls(context=ctx); s.login(SMTP_USER, SMTP_PASS); s.send_message(msg)
 
@@ -262,18 +369,23 @@ if __name__ == "__main__":
     mindate, maxdate = last_7d_window_ist(today_ist)
     print(f"[bot] Date window (IST, EDAT): {mindate} to {maxdate}")
 
-    term = pubmed_query(JOURNALS, KEYWORDS, humans=ADD_HUMANS_FILTER)
+    term = DEFAULT_TERM
     print(f"[bot] Query: {term}")
 
-    pmids = esearch(term, mindate, maxdate)
+    idlist, history = esearch(term, mindate, maxdate)
+    pmids = list(dict.fromkeys(idlist))  # order-preserving dedup
     print(f"[bot] ESearch PMIDs: {len(pmids)}")
 
-    items = esummary(pmids)
+    # The history set only matches an unmodified idlist; otherwise send the ids themselves.
+    items = esummary(history=history) if history and pmids == idlist else esummary(pmids)
     print(f"[bot] ESummary items: {len(items)}")
 
     need_meta = (INCLUDE_CONCLUSION_SNIPPET or ABSTRACTS_BASE_URL)
-    meta_map = efetch_abstract_map([it["pmid"] for it in items]) if need_meta else None
+    # Editorials, letters etc. have no abstract; don't spend efetch bytes on them.
+    pmids_with_abs = [it["pmid"] for it in items if it["hasabstract"]]
+    meta_map, cache_hits = cached_abstract_map(pmids_with_abs) if need_meta else (None, 0)
     if need_meta:
+        print(f"[bot] Abstract cache: {cache_hits} hits, {len(pmids_with_abs) - cache_hits} to fetch")
         got_abs = sum(1 for pid in (meta_map or {}) if (meta_map[pid].get("abstract") or ""))
         print(f"[bot] EFetch abstracts: {got_abs}/{len(items)}")
 